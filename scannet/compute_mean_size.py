@@ -0,0 +1,121 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+""" Compute the mean box size of each NYU40 class over the ScanNet training scenes.
+
+Every point row of a scene's *_all.npy carries the bbox of its instance
+(center, size, ..., nyu40 class), so rows are deduplicated per scene to
+count each instance once.
+"""
+import os
+import glob
+import argparse
+import zipfile
+import numpy as np
+from multiprocessing import Pool
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+NUM_NYU40_CLASS = 40
+IGNORE_CLASSES = [0, 38, 39, 40] # unannotated, otherstructure, otherfurniture, otherprop
+IS_IGNORED = np.zeros(NUM_NYU40_CLASS+1, dtype=bool)
+IS_IGNORED[IGNORE_CLASSES] = True
+MEAN_SIZE_FILE = os.path.join(BASE_DIR, 'meta_data/scannet_means_v2.npy')
+
+def scene_size_stats(data):
+    """ Per-class size sums (NUM_NYU40_CLASS+1,3) and instance counts (NUM_NYU40_CLASS+1,) of one scene """
+    mask = ~IS_IGNORED[data[:,-1].astype(np.int64)]
+    if not mask.any():
+        # e.g. scenes with only walls/floor annotated
+        return np.zeros((NUM_NYU40_CLASS+1, 3)), np.zeros(NUM_NYU40_CLASS+1, dtype=np.int64)
+    rows = np.unique(data[mask], axis=0)
+    labels = rows[:,-1].astype(np.int64)
+    # bincount is a single compiled pass, unlike the unbuffered np.add.at
+    sum_arr = np.stack([np.bincount(labels, weights=rows[:,3+i], minlength=NUM_NYU40_CLASS+1) for i in range(3)], 1)
+    cnt_arr = np.bincount(labels, minlength=NUM_NYU40_CLASS+1)
+    return sum_arr, cnt_arr
+
+def load_scene_size_stats(fin):
+    # rows are only read once, so let the OS page them in instead of copying the whole file
+    return scene_size_stats(np.load(fin, mmap_mode='r'))
+
+def reduce_mean_size(stats):
+    sum_arr = np.zeros((NUM_NYU40_CLASS+1, 3))
+    cnt_arr = np.zeros(NUM_NYU40_CLASS+1, dtype=np.int64)
+    for scene_sum, scene_cnt in stats:
+        sum_arr += scene_sum
+        cnt_arr += scene_cnt
+    # class i is stored at row i-1
+    mean_shape = sum_arr[1:] / np.maximum(cnt_arr[1:], 1)[:,None]
+    return mean_shape
+
+def compute_mean_size(flist, num_workers=None):
+    # the row dedup is CPU bound and holds the GIL, so scenes go to worker processes;
+    # each sends back only its small sum/count arrays, reduced here
+    with Pool(num_workers) as pool:
+        return reduce_mean_size(pool.imap_unordered(load_scene_size_stats, flist, chunksize=16))
+
+def pack_scenes(flist, archive):
+    """ Store all scenes in one .npz so later runs open a single file instead of one per scene """
+    # the .npy files are copied as-is, which is exactly the layout np.savez writes
+    with zipfile.ZipFile(archive, 'w') as zf:
+        for fin in flist:
+            zf.write(fin, os.path.basename(fin))
+
+def cached_mean_size(cache_file, inputs, compute):
+    """ Return the mean sizes cached in cache_file if the inputs did not change since, else compute and cache them
+    The cache key is the number of input files and the newest modification time among them.
+    """
+    key = np.array([len(inputs), max(os.path.getmtime(fin) for fin in inputs)])
+    if os.path.exists(cache_file):
+        cache = np.load(cache_file)
+        if np.array_equal(cache['key'], key):
+            return cache['mean_shape']
+    mean_shape = compute()
+    np.savez(cache_file, key=key, mean_shape=mean_shape)
+    return mean_shape
+
+worker_archive = None # the packed scenes, opened once in each worker process
+
+def open_worker_archive(archive):
+    global worker_archive
+    worker_archive = np.load(archive)
+
+def load_archive_scene_size_stats(name):
+    # zip members cannot be memory-mapped, so each scene is read into memory
+    return scene_size_stats(worker_archive[name])
+
+def compute_mean_size_archive(archive, num_workers=None):
+    with np.load(archive) as arch:
+        names = arch.files
+    # same worker pool as compute_mean_size, each worker reading its scenes from its own handle
+    with Pool(num_workers, initializer=open_worker_archive, initargs=(archive,)) as pool:
+        return reduce_mean_size(pool.imap_unordered(load_archive_scene_size_stats, names, chunksize=16))
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data_path', default=os.path.join(BASE_DIR, 'scannet_train_detection_data'), help='Folder of the *_all.npy scene files')
+    parser.add_argument('--archive', default=None, help='Packed scenes (.npz), read instead of data_path when it exists')
+    parser.add_argument('--pack', action='store_true', help='Pack data_path scenes into --archive first')
+    parser.add_argument('--cache', default=None, help='Cache file for the computed sizes [default: next to --archive, else scannet/mean_size_cache.npz]')
+    FLAGS = parser.parse_args()
+
+    flist = glob.glob(os.path.join(FLAGS.data_path, '*_all.npy'))
+    if not flist and (FLAGS.archive is None or FLAGS.pack or not os.path.exists(FLAGS.archive)):
+        parser.error('no *_all.npy scene files found in %s' % (FLAGS.data_path))
+    if FLAGS.cache is not None:
+        cache_file = FLAGS.cache
+    elif FLAGS.archive is not None:
+        cache_file = os.path.splitext(FLAGS.archive)[0] + '_mean_size_cache.npz'
+    else:
+        cache_file = os.path.join(BASE_DIR, 'mean_size_cache.npz')
+    if FLAGS.archive is not None:
+        if FLAGS.pack or not os.path.exists(FLAGS.archive):
+            pack_scenes(flist, FLAGS.archive)
+        mean_shape = cached_mean_size(cache_file, [FLAGS.archive], lambda: compute_mean_size_archive(FLAGS.archive))
+    else:
+        mean_shape = cached_mean_size(cache_file, flist, lambda: compute_mean_size(flist))
+    np.save(MEAN_SIZE_FILE, mean_shape)
+    print('done, saved to %s' % (MEAN_SIZE_FILE))
+    print(mean_shape)
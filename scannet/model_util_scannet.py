@@ -30,8 +30,11 @@ class ScannetDatasetConfig(object):
         
         self.nyu40id2class = {nyu40id: i for i,nyu40id in enumerate(list(self.nyu40ids))}
         self.nyu40id2class_sem = {nyu40id: i for i,nyu40id in enumerate(list(self.nyu40ids))}
+        # nyu40id2class as a lookup table over all nyu40 ids (0~40), -1 for ids not in nyu40ids
+        self.nyu40id2class_arr = np.full(41, -1, dtype=np.int64)
+        self.nyu40id2class_arr[self.nyu40ids] = np.arange(len(self.nyu40ids))
         self.mean_size_arr = np.load(os.path.join(ROOT_DIR,'scannet/meta_data/scannet_means.npz'))['arr_0']
-        #self.mean_size_arr = np.load(os.path.join(ROOT_DIR,'scannet/meta_data/scannet_means_v2.npz.npy'))[:self.num_class,:]
+        #self.mean_size_arr = np.load(os.path.join(ROOT_DIR,'scannet/meta_data/scannet_means_v2.npy'))[:self.num_class,:]
         self.type_mean_size = {}
         for i in range(self.num_size_cluster):
             self.type_mean_size[self.class2type[i]] = self.mean_size_arr[i,:]
@@ -26,17 +26,12 @@ MEAN_COLOR_RGB = np.array([109.8, 97.2, 83.8])
 DIST_THRESH = 0.2
 VAR_THRESH = 1e-2
 CENTER_THRESH = 0.1
-LOWER_THRESH = 1e-6
 NUM_POINT = 100
 NUM_POINT_LINE = 10
 LINE_THRESH = 0.2
 MIND_THRESH = 0.1
-
-def check_upright(para_points):
-    return (para_points[0][-1] == para_points[1][-1]) and (para_points[1][-1] == para_points[2][-1]) and (para_points[2][-1] == para_points[3][-1])
-
-def check_z(plane_equ, para_points):
-    return np.sum(para_points[:,2] + plane_equ[-1]) / 4.0 < LOWER_THRESH
+# corner signs in params2bbox order, z fastest then y then x
+BBOX_CORNER_SIGNS = np.array([[-1,-1,-1],[-1,-1,1],[-1,1,-1],[-1,1,1],[1,-1,-1],[1,-1,1],[1,1,-1],[1,1,1]])
 
 def params2bbox(center, xsize, ysize, zsize, angle):
     ''' from bbox_center, angle and size to bbox
@@ -49,6 +44,10 @@ def params2bbox(center, xsize, ysize, zsize, angle):
          [[xmin, ymin, zmin], [xmin, ymin, zmax], [xmin, ymax, zmin], [xmin, ymax, zmax],
           [xmax, ymin, zmin], [xmax, ymin, zmax], [xmax, ymax, zmin], [xmax, ymax, zmax]]
     '''
+    if angle == 0:
+        # axis aligned box (no heading, no rotation augmentation): skip the rotation
+        bbox = center + BBOX_CORNER_SIGNS * (np.abs(np.array([xsize, ysize, zsize])) / 2)
+        return bbox, bbox[0,0], bbox[0,1], bbox[0,2], bbox[7,0], bbox[7,1], bbox[7,2]
     vx = np.array([np.cos(angle), np.sin(angle), 0])
     vy = np.array([-np.sin(angle), np.cos(angle), 0])
     vx = vx * np.abs(xsize) / 2
@@ -73,6 +72,13 @@ def get_linesel2(points, ymin, ymax, zmin, zmax, axis=0):
     sel4 = np.abs(points[:,axis] - ymax) < LINE_THRESH
     return sel3, sel4
 
+def make_plane(normal, point):
+    ''' Plane (a,b,c,d) with normal (a,b,c) passing through point '''
+    plane = np.empty(4)
+    plane[:3] = normal
+    plane[3] = -np.dot(normal, point)
+    return plane
+
 class ScannetDetectionDataset(Dataset):
        
     def __init__(self, data_path=None, split_set='train', num_points=20000, center_dev=2.0, corner_dev=1.0,
@@ -111,6 +117,8 @@ class ScannetDetectionDataset(Dataset):
         self.corner_dev = corner_dev
         self.use_tsdf = use_tsdf
         self.use_18cls = use_18cls
+        # O(1) lookup of whether a nyu40 id is one of the detected classes
+        self.is_nyu40id = DC.nyu40id2class_arr >= 0
         
     def __len__(self):
         return len(self.scan_names)
@@ -132,8 +140,9 @@ class ScannetDetectionDataset(Dataset):
             pcl_color: unused
         """
         scan_name = self.scan_names[idx]
-        mesh_vertices = np.load(os.path.join(self.data_path, scan_name)+'_vert.npy')
-        meta_vertices = np.load(os.path.join(self.data_path, scan_name)+'_all_noangle_40cls.npy') ### Need to change the name here
+        # read-only memory maps: only the sampled rows are copied out below
+        mesh_vertices = np.load(os.path.join(self.data_path, scan_name)+'_vert.npy', mmap_mode='r')
+        meta_vertices = np.load(os.path.join(self.data_path, scan_name)+'_all_noangle_40cls.npy', mmap_mode='r') ### Need to change the name here
         
         instance_labels = meta_vertices[:,-2]
         semantic_labels = meta_vertices[:,-1]
@@ -142,7 +151,7 @@ class ScannetDetectionDataset(Dataset):
             point_cloud = mesh_vertices[:,0:3] # do not use color for now
             pcl_color = mesh_vertices[:,3:6]
         else:
-            point_cloud = mesh_vertices[:,0:6] 
+            point_cloud = np.array(mesh_vertices[:,0:6])
             point_cloud[:,3:] = (point_cloud[:,3:]-MEAN_COLOR_RGB)/256.0
             pcl_color = (point_cloud[:,3:]-MEAN_COLOR_RGB)/256.0
         
@@ -159,19 +168,9 @@ class ScannetDetectionDataset(Dataset):
         size_classes = np.zeros((MAX_NUM_OBJ,))
         size_residuals = np.zeros((MAX_NUM_OBJ, 3))
 
-        ### For statistics
-        surface_cue = np.zeros((MAX_NUM_OBJ))
-        line_cue = np.zeros((MAX_NUM_OBJ,))
-        
-        before_sample = np.unique(instance_labels)
-        while True:
-            orig_point_cloud = np.copy(point_cloud)
-            temp_point_cloud, choices = pc_util.random_sampling(orig_point_cloud,
-                                                           self.num_points, return_choices=True)
-            after_sample = np.unique(instance_labels[choices])
-            if np.array_equal(before_sample, after_sample):
-                point_cloud = temp_point_cloud
-                break
+        # keep every instance in the sampled points
+        point_cloud, choices = pc_util.random_sampling_keep_instances(point_cloud, instance_labels,
+                                                                      self.num_points, return_choices=True)
         instance_labels = instance_labels[choices]
         semantic_labels = semantic_labels[choices]
         meta_vertices = meta_vertices[choices]
@@ -224,47 +223,45 @@ class ScannetDetectionDataset(Dataset):
 
         point_sem_label = np.zeros(self.num_points)
         
-        selected_instances = []
-        selected_centers = []
-        selected_centers_support = []
-        selected_centers_bsupport = []
         obj_meta = []
 
-        counter = -1
-        for i_instance in np.unique(instance_labels):            
+        # group points by instance with one stable sort instead of a full scan per instance
+        inst_order = np.argsort(instance_labels, kind='stable')
+        _, inst_start = np.unique(instance_labels[inst_order], return_index=True)
+        inst_end = np.append(inst_start[1:], inst_order.shape[0])
+        for start, end in zip(inst_start, inst_end):
             # find all points belong to that instance
-            ind = np.where(instance_labels == i_instance)[0]
+            ind = inst_order[start:end]
 
-            if semantic_labels[ind[0]] in DC.nyu40ids:
-                counter += 1
-                idx_instance = counter
+            if self.is_nyu40id[int(semantic_labels[ind[0]])]:
                 x = point_cloud[ind,:3]
                 ### Meta information here
                 meta = meta_vertices[ind[0]]
                 obj_meta.append(meta)
+                sem_cls = DC.nyu40id2class_arr[int(meta[-1])]
                 
                 ### Get the centroid here
                 center = meta[:3]
 
                 point_votes[ind, :] = center - x
                 point_votes_mask[ind] = 1.0
-                point_sem_label[ind] = DC.nyu40id2class_sem[meta[-1]]
+                point_sem_label[ind] = sem_cls
                                 
                 ### Corners
                 corners, xmin, ymin, zmin, xmax, ymax, zmax = params2bbox(center, meta[3], meta[4], meta[5], meta[6])
                 
-                ## Get lower four lines
-                plane_lower_temp = np.array([0,0,1,-corners[6,-1]])
-                para_points = np.array([corners[1], corners[3], corners[5], corners[7]])
-                newd = np.sum(para_points * plane_lower_temp[:3], 1)
-                if check_upright(para_points) and plane_lower_temp[0]+plane_lower_temp[1] < LOWER_THRESH:
-                    plane_lower = np.array([0,0,1,plane_lower_temp[-1]]) 
-                    plane_upper = np.array([0,0,1,-np.mean(newd)])
-                else:
-                    import pdb;pdb.set_trace()
-                    print ("error with upright")
-                if check_z(plane_upper, para_points) == False:
-                    import pdb;pdb.set_trace()
+                ### Bbox planes in closed form: the box is upright, so lower/upper are z = zmin/zmax
+                ### and the side normals follow from the heading angle
+                normal_lower = np.array([0,0,1])
+                plane_lower = make_plane(normal_lower, corners[0])
+                plane_upper = make_plane(normal_lower, corners[7])
+                normal_left = np.array([-np.cos(meta[6]), -np.sin(meta[6]), 0])
+                plane_left = make_plane(normal_left, corners[0])
+                plane_right = make_plane(normal_left, corners[4])
+                normal_front = np.array([np.sin(meta[6]), -np.cos(meta[6]), 0])
+                plane_front = make_plane(normal_front, corners[0])
+                plane_back = make_plane(normal_front, corners[2])
+
                 ### Get the boundary points here
                 alldist = np.abs(np.sum(x*plane_lower[:3], 1) + plane_lower[-1])
                 mind = np.min(alldist)
@@ -277,31 +274,31 @@ class ScannetDetectionDataset(Dataset):
                     linecenter = np.mean(x[sel][line_sel1], axis=0)
                     linecenter[1] = (ymin+ymax)/2.0
                     point_line_offset[ind[sel][line_sel1]] = linecenter - x[sel][line_sel1]
-                    point_line_sem[ind[sel][line_sel1]] = np.array([linecenter[0], linecenter[1], linecenter[2], np.where(DC.nyu40ids == meta_vertices[ind[0],-1])[0][0]])
+                    point_line_sem[ind[sel][line_sel1]] = np.array([linecenter[0], linecenter[1], linecenter[2], sem_cls])
                 if np.sum(line_sel2) > NUM_POINT_LINE:
                     point_line_mask[ind[sel][line_sel2]] = 1.0
                     linecenter = np.mean(x[sel][line_sel2], axis=0)
                     linecenter[1] = (ymin+ymax)/2.0
                     point_line_offset[ind[sel][line_sel2]] = linecenter - x[sel][line_sel2]
-                    point_line_sem[ind[sel][line_sel2]] = np.array([linecenter[0], linecenter[1], linecenter[2], np.where(DC.nyu40ids == meta_vertices[ind[0],-1])[0][0]])
+                    point_line_sem[ind[sel][line_sel2]] = np.array([linecenter[0], linecenter[1], linecenter[2], sem_cls])
                 if np.sum(line_sel3) > NUM_POINT_LINE:
                     point_line_mask[ind[sel][line_sel3]] = 1.0
                     linecenter = np.mean(x[sel][line_sel3], axis=0)
                     linecenter[0] = (xmin+xmax)/2.0
                     point_line_offset[ind[sel][line_sel3]] = linecenter - x[sel][line_sel3]
-                    point_line_sem[ind[sel][line_sel3]] = np.array([linecenter[0], linecenter[1], linecenter[2], np.where(DC.nyu40ids == meta_vertices[ind[0],-1])[0][0]])
+                    point_line_sem[ind[sel][line_sel3]] = np.array([linecenter[0], linecenter[1], linecenter[2], sem_cls])
                 if np.sum(line_sel4) > NUM_POINT_LINE:
                     point_line_mask[ind[sel][line_sel4]] = 1.0
                     linecenter = np.mean(x[sel][line_sel4], axis=0)
                     linecenter[0] = (xmin+xmax)/2.0
                     point_line_offset[ind[sel][line_sel4]] = linecenter - x[sel][line_sel4]
-                    point_line_sem[ind[sel][line_sel4]] = np.array([linecenter[0], linecenter[1], linecenter[2], np.where(DC.nyu40ids == meta_vertices[ind[0],-1])[0][0]])
+                    point_line_sem[ind[sel][line_sel4]] = np.array([linecenter[0], linecenter[1], linecenter[2], sem_cls])
                 ### Set the surface labels here
                 if np.sum(sel) > NUM_POINT and np.var(alldist[sel]) < VAR_THRESH:
                     center = np.array([(xmin+xmax)/2.0, (ymin+ymax)/2.0, np.mean(x[sel][:,2])])
                     sel_global = ind[sel]
                     point_boundary_mask_z[sel_global] = 1.0
-                    point_boundary_sem_z[sel_global] = np.array([center[0], center[1], center[2], xmax - xmin, ymax - ymin, np.where(DC.nyu40ids == meta_vertices[ind[0],-1])[0][0]])
+                    point_boundary_sem_z[sel_global] = np.array([center[0], center[1], center[2], xmax - xmin, ymax - ymin, sem_cls])
                     point_boundary_offset_z[sel_global] = center - x[sel]
                                     
                 ### Get the boundary points here
@@ -315,50 +312,34 @@ class ScannetDetectionDataset(Dataset):
                     linecenter = np.mean(x[sel][line_sel1], axis=0)
                     linecenter[1] = (ymin+ymax)/2.0
                     point_line_offset[ind[sel][line_sel1]] = linecenter - x[sel][line_sel1]
-                    point_line_sem[ind[sel][line_sel1]] = np.array([linecenter[0], linecenter[1], linecenter[2], np.where(DC.nyu40ids == meta_vertices[ind[0],-1])[0][0]])
+                    point_line_sem[ind[sel][line_sel1]] = np.array([linecenter[0], linecenter[1], linecenter[2], sem_cls])
                 if np.sum(line_sel2) > NUM_POINT_LINE:
                     point_line_mask[ind[sel][line_sel2]] = 1.0
                     linecenter = np.mean(x[sel][line_sel2], axis=0)
                     linecenter[1] = (ymin+ymax)/2.0
                     point_line_offset[ind[sel][line_sel2]] = linecenter - x[sel][line_sel2]
-                    point_line_sem[ind[sel][line_sel2]] = np.array([linecenter[0], linecenter[1], linecenter[2], np.where(DC.nyu40ids == meta_vertices[ind[0],-1])[0][0]])
+                    point_line_sem[ind[sel][line_sel2]] = np.array([linecenter[0], linecenter[1], linecenter[2], sem_cls])
                 if np.sum(line_sel3) > NUM_POINT_LINE:
                     point_line_mask[ind[sel][line_sel3]] = 1.0
                     linecenter = np.mean(x[sel][line_sel3], axis=0)
                     linecenter[0] = (xmin+xmax)/2.0
                     point_line_offset[ind[sel][line_sel3]] = linecenter - x[sel][line_sel3]
-                    point_line_sem[ind[sel][line_sel3]] = np.array([linecenter[0], linecenter[1], linecenter[2], np.where(DC.nyu40ids == meta_vertices[ind[0],-1])[0][0]])
+                    point_line_sem[ind[sel][line_sel3]] = np.array([linecenter[0], linecenter[1], linecenter[2], sem_cls])
                 if np.sum(line_sel4) > NUM_POINT_LINE:
                     point_line_mask[ind[sel][line_sel4]] = 1.0
                     linecenter = np.mean(x[sel][line_sel4], axis=0)
                     linecenter[0] = (xmin+xmax)/2.0
                     point_line_offset[ind[sel][line_sel4]] = linecenter - x[sel][line_sel4]
-                    point_line_sem[ind[sel][line_sel4]] = np.array([linecenter[0], linecenter[1], linecenter[2], np.where(DC.nyu40ids == meta_vertices[ind[0],-1])[0][0]])
+                    point_line_sem[ind[sel][line_sel4]] = np.array([linecenter[0], linecenter[1], linecenter[2], sem_cls])
                 
                 if np.sum(sel) > NUM_POINT and np.var(alldist[sel]) < VAR_THRESH:
                     center = np.array([(xmin+xmax)/2.0, (ymin+ymax)/2.0, np.mean(x[sel][:,2])])
                     sel_global = ind[sel]
                     point_boundary_mask_z[sel_global] = 1.0
-                    point_boundary_sem_z[sel_global] = np.array([center[0], center[1], center[2], xmax - xmin, ymax - ymin, np.where(DC.nyu40ids == meta_vertices[ind[0],-1])[0][0]])
+                    point_boundary_sem_z[sel_global] = np.array([center[0], center[1], center[2], xmax - xmin, ymax - ymin, sem_cls])
                     point_boundary_offset_z[sel_global] = center - x[sel]
                                     
                 ## Get left two lines
-                v1 = corners[3] - corners[2]
-                v2 = corners[2] - corners[0]
-                cp = np.cross(v1, v2)
-                d = -np.dot(cp,corners[0])
-                a,b,c = cp
-                plane_left_temp = np.array([a, b, c, d])
-                para_points = np.array([corners[4], corners[5], corners[6], corners[7]])
-                ### Normalize xy here
-                plane_left_temp /= np.linalg.norm(plane_left_temp[:3])
-                newd = np.sum(para_points * plane_left_temp[:3], 1)
-                if plane_left_temp[2] < LOWER_THRESH:
-                    plane_left = plane_left_temp#np.array([cls,res,tempsign,plane_left_temp[-1]]) 
-                    plane_right = np.array([plane_left_temp[0], plane_left_temp[1], plane_left_temp[2], -np.mean(newd)])
-                else:
-                    import pdb;pdb.set_trace()
-                    print ("error with upright")
                 ### Get the boundary points here
                 alldist = np.abs(np.sum(x*plane_left[:3], 1) + plane_left[-1])
                 mind = np.min(alldist)
@@ -370,18 +351,18 @@ class ScannetDetectionDataset(Dataset):
                     linecenter = np.mean(x[sel][line_sel1], axis=0)
                     linecenter[2] = (zmin+zmax)/2.0
                     point_line_offset[ind[sel][line_sel1]] = linecenter - x[sel][line_sel1]
-                    point_line_sem[ind[sel][line_sel1]] = np.array([linecenter[0], linecenter[1], linecenter[2], np.where(DC.nyu40ids == meta_vertices[ind[0],-1])[0][0]])
+                    point_line_sem[ind[sel][line_sel1]] = np.array([linecenter[0], linecenter[1], linecenter[2], sem_cls])
                 if np.sum(line_sel2) > NUM_POINT_LINE:
                     point_line_mask[ind[sel][line_sel2]] = 1.0
                     linecenter = np.mean(x[sel][line_sel2], axis=0)
                     linecenter[2] = (zmin+zmax)/2.0
                     point_line_offset[ind[sel][line_sel2]] = linecenter - x[sel][line_sel2]
-                    point_line_sem[ind[sel][line_sel2]] = np.array([linecenter[0], linecenter[1], linecenter[2], np.where(DC.nyu40ids == meta_vertices[ind[0],-1])[0][0]])
+                    point_line_sem[ind[sel][line_sel2]] = np.array([linecenter[0], linecenter[1], linecenter[2], sem_cls])
                 if np.sum(sel) > NUM_POINT and np.var(alldist[sel]) < VAR_THRESH:
                     center = np.array([np.mean(x[sel][:,0]), np.mean(x[sel][:,1]), (zmin+zmax)/2.0])
                     sel_global = ind[sel]
                     point_boundary_mask_xy[sel_global] = 1.0
-                    point_boundary_sem_xy[sel_global] = np.array([center[0], center[1], center[2], zmax - zmin, np.where(DC.nyu40ids == meta_vertices[ind[0],-1])[0][0]])
+                    point_boundary_sem_xy[sel_global] = np.array([center[0], center[1], center[2], zmax - zmin, sem_cls])
                     point_boundary_offset_xy[sel_global] = center - x[sel]
                     
                 ### Get the boundary points here
@@ -394,37 +375,21 @@ class ScannetDetectionDataset(Dataset):
                     linecenter = np.mean(x[sel][line_sel1], axis=0)
                     linecenter[2] = (zmin+zmax)/2.0
                     point_line_offset[ind[sel][line_sel1]] = linecenter - x[sel][line_sel1]
-                    point_line_sem[ind[sel][line_sel1]] = np.array([linecenter[0], linecenter[1], linecenter[2], np.where(DC.nyu40ids == meta_vertices[ind[0],-1])[0][0]])
+                    point_line_sem[ind[sel][line_sel1]] = np.array([linecenter[0], linecenter[1], linecenter[2], sem_cls])
                 if np.sum(line_sel2) > NUM_POINT_LINE:
                     point_line_mask[ind[sel][line_sel2]] = 1.0
                     linecenter = np.mean(x[sel][line_sel2], axis=0)
                     linecenter[2] = (zmin+zmax)/2.0
                     point_line_offset[ind[sel][line_sel2]] = linecenter - x[sel][line_sel2]
-                    point_line_sem[ind[sel][line_sel2]] = np.array([linecenter[0], linecenter[1], linecenter[2], np.where(DC.nyu40ids == meta_vertices[ind[0],-1])[0][0]])
+                    point_line_sem[ind[sel][line_sel2]] = np.array([linecenter[0], linecenter[1], linecenter[2], sem_cls])
                 if np.sum(sel) > NUM_POINT and np.var(alldist[sel]) < VAR_THRESH:
                     center = np.array([np.mean(x[sel][:,0]), np.mean(x[sel][:,1]), (zmin+zmax)/2.0])
                     sel_global = ind[sel]
                     point_boundary_mask_xy[sel_global] = 1.0
-                    point_boundary_sem_xy[sel_global] = np.array([center[0], center[1], center[2], zmax - zmin, np.where(DC.nyu40ids == meta_vertices[ind[0],-1])[0][0]])
+                    point_boundary_sem_xy[sel_global] = np.array([center[0], center[1], center[2], zmax - zmin, sem_cls])
                     point_boundary_offset_xy[sel_global] = center - x[sel]
                                         
                 ### Get the boundary points here
-                v1 = corners[0] - corners[4]
-                v2 = corners[4] - corners[5]
-                cp = np.cross(v1, v2)
-                d = -np.dot(cp,corners[5])
-                a,b,c = cp
-                plane_front_temp = np.array([a, b, c, d])
-                para_points = np.array([corners[2], corners[3], corners[6], corners[7]])
-                plane_front_temp /= np.linalg.norm(plane_front_temp[:3])
-                newd = np.sum(para_points * plane_front_temp[:3], 1)
-                if plane_front_temp[2] < LOWER_THRESH:
-                    plane_front = plane_front_temp
-                    plane_back = np.array([plane_front_temp[0], plane_front_temp[1], plane_front_temp[2], -np.mean(newd)])
-                else:
-                    import pdb;pdb.set_trace()
-                    print ("error with upright")
-                ### Get the boundary points here
                 alldist = np.abs(np.sum(x*plane_front[:3], 1) + plane_front[-1])
                 mind = np.min(alldist)
                 sel = np.abs(alldist - mind) < DIST_THRESH
@@ -432,7 +397,7 @@ class ScannetDetectionDataset(Dataset):
                     center = np.array([np.mean(x[sel][:,0]), np.mean(x[sel][:,1]), (zmin+zmax)/2.0])
                     sel_global = ind[sel]
                     point_boundary_mask_xy[sel_global] = 1.0
-                    point_boundary_sem_xy[sel_global] = np.array([center[0], center[1], center[2], zmax - zmin, np.where(DC.nyu40ids == meta_vertices[ind[0],-1])[0][0]])
+                    point_boundary_sem_xy[sel_global] = np.array([center[0], center[1], center[2], zmax - zmin, sem_cls])
                     point_boundary_offset_xy[sel_global] = center - x[sel]
                                     
                 ### Get the boundary points here
@@ -443,7 +408,7 @@ class ScannetDetectionDataset(Dataset):
                     center = np.array([np.mean(x[sel][:,0]), np.mean(x[sel][:,1]), (zmin+zmax)/2.0])
                     sel_global = ind[sel]
                     point_boundary_mask_xy[sel_global] = 1.0
-                    point_boundary_sem_xy[sel_global] = np.array([center[0], center[1], center[2], zmax - zmin, np.where(DC.nyu40ids == meta_vertices[ind[0],-1])[0][0]])
+                    point_boundary_sem_xy[sel_global] = np.array([center[0], center[1], center[2], zmax - zmin, sem_cls])
                     point_boundary_offset_xy[sel_global] = center - x[sel]
                     
         num_instance = len(obj_meta)
@@ -453,7 +418,7 @@ class ScannetDetectionDataset(Dataset):
         target_bboxes_mask[0:num_instance] = 1
         target_bboxes[0:num_instance,:6] = obj_meta[:,0:6]
         
-        class_ind = [np.where(DC.nyu40ids == x)[0][0] for x in obj_meta[:,-1]]   
+        class_ind = DC.nyu40id2class_arr[obj_meta[:,-1].astype(np.int64)]
         # NOTE: set size class as semantic class. Consider use size2class.
         size_classes[0:num_instance] = class_ind
         size_residuals[0:num_instance, :] = \
@@ -477,8 +442,7 @@ class ScannetDetectionDataset(Dataset):
             ret_dict['floor_height'] = floor_height
         
         target_bboxes_semcls = np.zeros((MAX_NUM_OBJ))                                
-        target_bboxes_semcls[0:num_instance] = \
-            [DC.nyu40id2class[x] for x in obj_meta[:,-1][0:obj_meta.shape[0]]]                
+        target_bboxes_semcls[0:num_instance] = class_ind
         ret_dict['sem_cls_label'] = target_bboxes_semcls.astype(np.int64)
 
         ret_dict['point_sem_cls_label'] = point_sem_label.astype(np.int64)
@@ -504,12 +468,53 @@ class ScannetDetectionDataset(Dataset):
         
         return ret_dict
         
+def my_worker_init_fn(worker_id):
+    np.random.seed(np.random.get_state()[1][0] + worker_id)
+
+def unbatched_collate_fn(batch):
+    """ Return the single example of a batch_size=1 batch as is, i.e. as numpy arrays """
+    return batch[0]
+
 if __name__=='__main__':
+    import io
+    import zipfile
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from torch.utils.data import DataLoader
     dset = ScannetDetectionDataset(split_set='train', use_height=True, num_points=50000, augment=False, use_angle=False)
-    for i_example in range(len(dset.scan_names)):
-        example = dset.__getitem__(i_example)
-        pc_util.write_ply(example['point_clouds'], 'pc_{}.ply'.format(i_example))
-        pc_util.write_ply(example['point_clouds'][example['point_line_mask']==1,0:3], 'pc_obj_line{}.ply'.format(i_example))
-        pc_util.write_ply(example['point_clouds'][example['point_boundary_mask_z']==1,0:3], 'pc_obj_boundary_z{}.ply'.format(i_example))
-        pc_util.write_ply(example['point_clouds'][example['point_boundary_mask_xy']==1,0:3], 'pc_obj_boundary_xy{}.ply'.format(i_example))
-        print (i_example)
+    # examples are independent, so build them in worker processes and only write them out here;
+    # keep them as unbatched numpy arrays
+    loader = DataLoader(dset, batch_size=1, shuffle=False, num_workers=os.cpu_count(),
+        collate_fn=unbatched_collate_fn, worker_init_fn=my_worker_init_fn)
+    # a few PLYs per scene add up to thousands of small files, so store them all in one uncompressed zip;
+    # overlap the writes with loading the next example, every array written is owned by its example.
+    # the executor exits first, so pending writes are drained before the zip is closed
+    archive_lock = threading.Lock()
+    with zipfile.ZipFile('scannet_viz.zip', 'w', zipfile.ZIP_STORED) as archive, \
+            ThreadPoolExecutor(max_workers=4) as writer:
+        def write_ply_to_archive(points, filename):
+            buf = io.BytesIO()
+            pc_util.write_ply(points, buf, text=False)
+            with archive_lock: # ZipFile is not thread safe
+                archive.writestr(filename, buf.getvalue())
+        def dump_example(example, i_example):
+            """ Queue the PLYs of one example, all taken from a single float32 copy of its points """
+            pc = np.ascontiguousarray(example['point_clouds'], dtype=np.float32)
+            xyz = pc[:,0:3]
+            # the 0/1 float masks index directly once they are bool
+            line_mask = example['point_line_mask'].astype(bool)
+            boundary_mask_z = example['point_boundary_mask_z'].astype(bool)
+            boundary_mask_xy = example['point_boundary_mask_xy'].astype(bool)
+            return [writer.submit(write_ply_to_archive, pc, 'pc_{}.ply'.format(i_example)),
+                writer.submit(write_ply_to_archive, xyz[line_mask], 'pc_obj_line{}.ply'.format(i_example)),
+                writer.submit(write_ply_to_archive, xyz[boundary_mask_z], 'pc_obj_boundary_z{}.ply'.format(i_example)),
+                writer.submit(write_ply_to_archive, xyz[boundary_mask_xy], 'pc_obj_boundary_xy{}.ply'.format(i_example))]
+        writes = []
+        for i_example, example in enumerate(loader):
+            # wait for the previous example so queued arrays do not pile up; this also re-raises write errors
+            for w in writes:
+                w.result()
+            writes = dump_example(example, i_example)
+            print (i_example)
+        for w in writes:
+            w.result()
@@ -36,6 +36,7 @@ from model_util_sunrgbd import SunrgbdDatasetConfig
 DC = SunrgbdDatasetConfig() # dataset specific config
 MAX_NUM_OBJ = 64 # maximum number of objects allowed per scene
 MEAN_COLOR_RGB = np.array([0.5,0.5,0.5]) # sunrgbd color is in 0~1
+MEAN_SIZE_ARR = np.ascontiguousarray(DC.mean_size_arr, dtype=np.float32) # (num_size_cluster,3) lookup for visualization
 
 DIST_THRESH = 0.1#0.2
 VAR_THRESH = 5e-3
@@ -647,6 +648,7 @@ def viz_votes(pc, point_votes, point_votes_mask):
     pc: (N,3 or 6), point_votes: (N,9), point_votes_mask: (N,)
     """
     inds = (point_votes_mask==1)
+    if not np.any(inds): return
     pc_obj = pc[inds,0:3]
     pc_obj_voted1 = pc_obj + point_votes[inds,0:3]
     pc_obj_voted2 = pc_obj + point_votes[inds,3:6]
@@ -657,7 +659,7 @@ def viz_votes(pc, point_votes, point_votes_mask):
     pc_util.write_ply(pc_obj_voted3, 'pc_obj_voted3.ply')
 
 def viz_obb(pc, label, mask, angle_classes, angle_residuals,
-    size_classes, size_residuals):
+    size_classes, size_residuals, export_mesh=False):
     """ Visualize oriented bounding box ground truth
     pc: (N,3)
     label: (K,3)  K == MAX_NUM_OBJ
@@ -666,21 +668,22 @@ def viz_obb(pc, label, mask, angle_classes, angle_residuals,
     angle_residuals: (K,)
     size_classes: (K,)
     size_residuals: (K,3)
+    export_mesh: also write the boxes as a PLY mesh, otherwise only the (n,7) boxes are saved to gt_obbs.npy
     """
-    oriented_boxes = []
-    K = label.shape[0]
-    for i in range(K):
-        if mask[i] == 0: continue
-        obb = np.zeros(7)
-        obb[0:3] = label[i,0:3]
-        heading_angle = DC.class2angle(angle_classes[i], angle_residuals[i])
-        box_size = DC.class2size(size_classes[i], size_residuals[i])
-        obb[3:6] = box_size
-        obb[6] = -1 * heading_angle
-        print(obb)
-        oriented_boxes.append(obb)
-    pc_util.write_oriented_bbox(oriented_boxes, 'gt_obbs.ply')
-    pc_util.write_ply(label[mask==1,:], 'gt_centroids.ply')
+    sel = mask==1
+    if not np.any(sel): return
+    # same as DC.class2angle/DC.class2size, for all boxes at once
+    heading_angle = angle_classes[sel] * (2*np.pi/float(DC.num_heading_bin)) + angle_residuals[sel]
+    heading_angle[heading_angle>np.pi] -= 2*np.pi
+    oriented_boxes = np.zeros((np.sum(sel), 7), dtype=np.float32)
+    oriented_boxes[:,0:3] = label[sel,0:3]
+    oriented_boxes[:,3:6] = MEAN_SIZE_ARR[size_classes[sel].astype(np.int64)] + size_residuals[sel]
+    oriented_boxes[:,6] = -1 * heading_angle
+    np.save('gt_obbs.npy', oriented_boxes)
+    if export_mesh:
+        # meshing every box with trimesh is by far the slowest part
+        pc_util.write_oriented_bbox(oriented_boxes, 'gt_obbs.ply')
+    pc_util.write_ply(label[sel,:], 'gt_centroids.ply')
 
 def get_sem_cls_statistics():
     """ Compute number of objects for each semantic class """
@@ -706,7 +709,6 @@ if __name__=='__main__':
         print(i)
         sample = d[i]
     # sample = d[200]
-    import ipdb; ipdb.set_trace()
     print(sample['vote_label'].shape, sample['vote_label_mask'].shape)
     pc_util.write_ply(sample['point_clouds'], 'pc.ply')
     viz_votes(sample['point_clouds'], sample['vote_label'], sample['vote_label_mask'])
@@ -63,6 +63,30 @@ def random_sampling(pc, num_sample, replace=None, return_choices=False):
     else:
         return pc[choices]
 
+def random_sampling_keep_instances(pc, instance_labels, num_sample, return_choices=False):
+    """ Input is NxC, output is num_samplexC with at least one point of
+        every instance in instance_labels (N,) kept; the rest is sampled uniformly
+    """
+    N = pc.shape[0]
+    perm = np.random.permutation(N)
+    _, first = np.unique(instance_labels[perm], return_index=True)
+    keep = perm[first] # one random point per instance
+    assert(keep.shape[0] <= num_sample)
+    rest_mask = np.ones(N, dtype=bool)
+    rest_mask[keep] = False
+    rest = np.where(rest_mask)[0]
+    num_rest = num_sample - keep.shape[0]
+    if rest.shape[0] >= num_rest:
+        fill = np.random.choice(rest, num_rest, replace=False)
+    else:
+        fill = np.random.choice(N, num_rest, replace=True)
+    choices = np.concatenate([keep, fill])
+    np.random.shuffle(choices)
+    if return_choices:
+        return pc[choices], choices
+    else:
+        return pc[choices]
+
 # ----------------------------------------
 # Point Cloud/Volume Conversions
 # ----------------------------------------
@@ -222,8 +246,10 @@ def read_ply(filename):
 
 def write_ply(points, filename, text=True):
     """ input: Nx3, write points to filename as PLY format. """
-    points = [(points[i,0], points[i,1], points[i,2]) for i in range(points.shape[0])]
-    vertex = np.array(points, dtype=[('x', 'f4'), ('y', 'f4'),('z', 'f4')])
+    vertex = np.empty(points.shape[0], dtype=[('x', 'f4'), ('y', 'f4'),('z', 'f4')])
+    vertex['x'] = points[:,0]
+    vertex['y'] = points[:,1]
+    vertex['z'] = points[:,2]
     el = PlyElement.describe(vertex, 'vertex', comments=['vertices'])
     PlyData([el], text=text).write(filename)
 
@@ -303,14 +329,17 @@ def write_ply_label(points, labels, filename, num_classes, colormap=pyplot.cm.je
     #cdict = construct_dict(labels, predict=pre_dict)
             
     #num_classes = len(cdict.keys())
-    vertex = []
     #colors = [pyplot.cm.jet(i/float(num_classes)) for i in range(num_classes)]    
-    colors = [colormap(i/float(num_classes)) for i in range(num_classes)]    
-    for i in range(N):
-        c = colors[labels[i]]
-        c = [int(x*255) for x in c]
-        vertex.append( (points[i,0],points[i,1],points[i,2],c[0],c[1],c[2]) )
-    vertex = np.array(vertex, dtype=[('x', 'f4'), ('y', 'f4'),('z', 'f4'),('red', 'u1'), ('green', 'u1'),('blue', 'u1')])
+    # (num_classes,3) uint8 palette, looked up for all points at once
+    colors = (np.array([colormap(i/float(num_classes)) for i in range(num_classes)])[:,0:3]*255).astype(np.uint8)
+    c = colors[labels]
+    vertex = np.empty(N, dtype=[('x', 'f4'), ('y', 'f4'),('z', 'f4'),('red', 'u1'), ('green', 'u1'),('blue', 'u1')])
+    vertex['x'] = points[:,0]
+    vertex['y'] = points[:,1]
+    vertex['z'] = points[:,2]
+    vertex['red'] = c[:,0]
+    vertex['green'] = c[:,1]
+    vertex['blue'] = c[:,2]
     
     el = PlyElement.describe(vertex, 'vertex', comments=['vertices'])
     PlyData([el], text=True).write(filename)
@@ -795,10 +824,7 @@ def point_cloud_to_voxel_scene(pt, vs=0.06, xymin=-3.84, xymax=3.84, zmin=-0.2,
   return vox
 
 def crop_point_cloud(pt,xymin=-3.84, xymax=3.84, zmin=-0.2, zmax=2.68):
-  crop_ids=[]
-  for i in range(pt.shape[0]):
-    if pt[i,0]>xymin and pt[i,0]<xymax and pt[i,1]>xymin and pt[i,1]<xymax and pt[i,2]>zmin and pt[i,2]<zmax:
-      crop_ids.append(i)
+  crop_ids = np.where((pt[:,0]>xymin) & (pt[:,0]<xymax) & (pt[:,1]>xymin) & (pt[:,1]<xymax) & (pt[:,2]>zmin) & (pt[:,2]<zmax))[0]
   pt = pt[crop_ids]
   return pt, crop_ids
 